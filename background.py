@@ -20,32 +20,53 @@ not responsible for it.
 
 import argparse
 import collections
+import concurrent.futures
+import configparser
 import datetime
+import functools
+import hashlib
 import http
+import json
 import logging
+import operator
 import os
-import pprint
 import random
-import re
+import shutil
 import subprocess
 import sys
 import tempfile
-import time
 from typing import List, Optional, Union, ValuesView
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+
+XRANDR_CMD = ['xrandr', '--listactivemonitors']
+
+
+@functools.lru_cache(maxsize=1)
+def _xrandr_active() -> bytes:
+    '''List the active monitors with xrandr, only once per process'''
+    # Python file descriptors are not inheritable, so there is no need to
+    # go through all of them to close them in the child
+    return subprocess.check_output(XRANDR_CMD, close_fds=False)
 
 
 class RedditPost:
     '''Reddit post class to ease the handling of Reddit posts'''
     ATTRS = ['author', 'created', 'name', 'permalink', 'title', 'url']
-    __slots__ = ATTRS + ['ext']
-    IMG_EXTS = ['jpg','png']
+    ATTRS_GETTER = operator.itemgetter(*ATTRS)
+    __slots__ = ATTRS + ['ext', '_session']
+    IMG_EXTS = frozenset(['jpeg', 'jpg', 'png'])
+    IMG_SUFFIXES = ('.jpeg', '.jpg', '.png')
+    CHUNK_SIZE = 64 * 1024
+    TIMEOUT = (5, 30)
 
     class UnknownPost(Exception):
         '''Reddit unknown post type specific error'''
 
-    def __init__(self, data):
+    def __init__(self, data, session: requests.Session):
         self.author: str
         self.created: str
         self.name: str
@@ -54,35 +75,39 @@ class RedditPost:
         self.url: str
         if data['kind'] != 't3':
             raise self.UnknownPost(f'Unknown post {data["kind"]}')
-        for attr in self.ATTRS:
-            setattr(self, attr, data['data'][attr])
+        (self.author, self.created, self.name, self.permalink, self.title,
+         self.url) = self.ATTRS_GETTER(data['data'])
         try:
             _, self.ext = self.url.rsplit('.', 1)
         except ValueError:
             self.ext = None
+        self._session = session
 
     def __str__(self):
         return self.title
 
     def is_image(self):
         '''Returns true if the post is an image'''
-        if self.ext not in self.IMG_EXTS:
+        if self.ext is None or self.ext.lower() not in self.IMG_EXTS:
             return False
         return True
 
     def download_imig(self, img_dest):
         '''Download the image from the post'''
-        resp = requests.get(self.url)
-        resp.raise_for_status()
-        with open(img_dest, 'wb') as dest_fp:
-            dest_fp.write(resp.content)
+        with self._session.get(self.url, stream=True,
+                               timeout=self.TIMEOUT) as resp:
+            resp.raise_for_status()
+            resp.raw.decode_content = True
+            with open(img_dest, 'wb') as dest_fp:
+                shutil.copyfileobj(resp.raw, dest_fp, length=self.CHUNK_SIZE)
         return img_dest
 
     def download_meta(self, meta_dest):
         '''Download the metadata from the post'''
         with open(meta_dest, 'wt', encoding='utf-8') as dest_fp:
-            dest_fp.write(pprint.pformat(
-                {attr: getattr(self, attr) for attr in self.ATTRS}, indent=2))
+            dest_fp.write(json.dumps(
+                {attr: getattr(self, attr) for attr in self.ATTRS}, indent=2,
+                ensure_ascii=False))
 
 
 class Displays(collections.UserDict):
@@ -95,8 +120,6 @@ class Displays(collections.UserDict):
         ...
     }
     '''
-    REGEX = re.compile(r'\s*(?P<num>\d+).+\s(?P<name>\S+)')
-
     class Display(collections.namedtuple('Display', ['num', 'name'])):
         '''Xrandr display representation'''
         def __str__(self):
@@ -106,15 +129,20 @@ class Displays(collections.UserDict):
         '''Display specific error'''
 
     def __init__(self, **data):
-        cmd = ['xrandr', '--listactivemonitors']
         try:
-            cmd_output = subprocess.check_output(cmd)
+            cmd_output = _xrandr_active()
         except subprocess.CalledProcessError as exc:
             raise Displays.Error(
-                'Failed to run "{" ".join(cmd)}": {exc}') from exc
-        for match in self.REGEX.finditer(cmd_output.decode()):
-            info = match.groupdict()
-            data[info['name']] = self.Display(int(info['num']), info['name'])
+                f'Failed to run "{" ".join(XRANDR_CMD)}": {exc}') from exc
+        # Skip the "Monitors: N" header, then parse the
+        # " N: +*NAME WxH+X+Y  NAME" lines
+        for line in cmd_output.splitlines()[1:]:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            num = int(fields[0].rstrip(b':'))
+            name = fields[-1].decode()
+            data[name] = self.Display(num, name)
         if not data:
             raise Displays.Error('Failed to find display information')
         super().__init__(**data)
@@ -152,12 +180,22 @@ class BackgroundChanger:
     background of the display(s)
     '''
     BACKGROUND_CHANGING_TOOL = 'nitrogen --set-zoom-fill'
+    # nitrogen "zoom fill" mode value in its configuration file
+    NITROGEN_MODE_ZOOM_FILL = 5
     USER_AGENT = 'BG changer 0.1'
-    REDDIT_JSON_TEMPLATE = 'http://www.reddit.com/r/{}/top/.json'
+    REDDIT_JSON_TEMPLATE = ('https://www.reddit.com/r/{}/top.json'
+                            '?limit={}&raw_json=1&t=day')
+    # Request more posts than displays, as not all of them are images
+    POSTS_PER_DISPLAY = 4
+    # (connect, read) timeouts of the listing requests, in seconds
+    TIMEOUT = (5, 30)
+    CACHE_DIR = os.path.join(
+        os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+        'bgchanger')
 
     def __init__(self, subreddits,
                  display: Optional[List[Displays.Display]] = None,
-                 loglevel=0):
+                 loglevel=0, tool: str = BACKGROUND_CHANGING_TOOL):
         logging.basicConfig(format='%(name)s: %(message)s')
         self.logger = logging.getLogger('BackgroundChanger')
         self.displays: Union[List[Displays.Display],
@@ -168,6 +206,17 @@ class BackgroundChanger:
             self.displays = display
         self.selected: List[RedditPost] = []
         self.subreddits = subreddits
+        self.tool = tool
+        self.session = requests.Session()
+        retries = Retry(total=5, backoff_factor=2,
+                        status_forcelist=[429, 500, 502, 503, 504],
+                        respect_retry_after_header=True,
+                        allowed_methods=['GET'])
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16,
+                              max_retries=retries)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'User-Agent': self.USER_AGENT})
 
         if loglevel:
             if loglevel == 1:
@@ -176,32 +225,80 @@ class BackgroundChanger:
             elif loglevel >= 2:
                 logging.getLogger().setLevel(logging.DEBUG)
                 self.logger.setLevel(logging.DEBUG)
-        self.logger.info('Updating background from subreddit(s) "%s" on "%s"',
-                         ', '.join(self.subreddits),
-                         ', '.join(str(display) for display in self.displays))
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(
+                'Updating background from subreddit(s) "%s" on "%s"',
+                ', '.join(self.subreddits), ', '.join(map(str, self.displays)))
 
-    def _subreddit_load(self, subreddit) -> List[RedditPost]:
-        resp = requests.get(self.REDDIT_JSON_TEMPLATE.format(subreddit),
-                            headers={'User-agent': self.USER_AGENT})
+    def _cache_write(self, path, content: bytes):
+        '''Atomically replace the cache file "path" with "content"'''
         try:
-            resp.raise_for_status()
-        except requests.HTTPError as exc:
-            if ((exc.response.status_code ==
-                 http.HTTPStatus.TOO_MANY_REQUESTS)):
-                self.logger.warning(
-                    'Too many requests sent, waiting 1 min')
-                time.sleep(60)
-                return []
-            raise exc
+            os.makedirs(self.CACHE_DIR, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.CACHE_DIR,
+                                             delete=False) as tmp_fp:
+                tmp_fp.write(content)
+            os.replace(tmp_fp.name, path)
+        except OSError as exc:
+            self.logger.warning('Failed to write cache file "%s": %s',
+                                path, exc)
+
+    def _cached_get_json(self, url):
+        '''
+        Get the JSON object at "url", revalidating a previously cached response
+        with its ETag / Last-Modified headers to avoid downloading it again
+        when it did not change
+        '''
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        body_path = os.path.join(self.CACHE_DIR, f'{digest}.json')
+        meta_path = os.path.join(self.CACHE_DIR, f'{digest}.meta.json')
+        headers = {}
+        if os.path.exists(body_path):
+            try:
+                with open(meta_path, encoding='utf-8') as meta_fp:
+                    cache_meta = json.load(meta_fp)
+            except (OSError, ValueError):
+                cache_meta = {}
+            if cache_meta.get('etag'):
+                headers['If-None-Match'] = cache_meta['etag']
+            if cache_meta.get('last-modified'):
+                headers['If-Modified-Since'] = cache_meta['last-modified']
+
+        resp = self.session.get(url, headers=headers,
+                                timeout=self.TIMEOUT)
+        if resp.status_code == http.HTTPStatus.NOT_MODIFIED:
+            self.logger.info('Using cached response for %s', url)
+            try:
+                with open(body_path, encoding='utf-8') as body_fp:
+                    return json.load(body_fp)
+            except (OSError, ValueError) as exc:
+                self.logger.warning('Failed to read cache file "%s": %s',
+                                    body_path, exc)
+                resp = self.session.get(url, timeout=self.TIMEOUT)
+        resp.raise_for_status()
         json_obj = resp.json()
-        self.logger.debug('JSON response: %s', pprint.pformat(json_obj))
+        self._cache_write(body_path, resp.content)
+        self._cache_write(meta_path, json.dumps({
+            'etag': resp.headers.get('ETag'),
+            'last-modified': resp.headers.get('Last-Modified'),
+        }).encode())
+        return json_obj
+
+    def _subreddit_load(self, subreddit) -> List[RedditPost]:
+        json_obj = self._cached_get_json(self.REDDIT_JSON_TEMPLATE.format(
+            subreddit, len(self.displays) * self.POSTS_PER_DISPLAY))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('JSON response: %s',
+                              json.dumps(json_obj, indent=2))
         try:
-            posts = [RedditPost(post) for post in json_obj['data']['children']]
+            posts = [RedditPost(post, self.session)
+                     for post in json_obj['data']['children']
+                     if post.get('data', {}).get('url', '').lower().endswith(
+                         RedditPost.IMG_SUFFIXES)]
         except KeyError as key_err:
             self.logger.error('Could not find %s in the JSON response, exiting',
                               key_err)
             return []
-        self.logger.info('%d total posts found', len(posts))
+        self.logger.info('%d image posts found', len(posts))
         return posts
 
     def load(self):
@@ -209,17 +306,14 @@ class BackgroundChanger:
         Load Reddit posts for the subreddits, and randomly selects as many as
         the number of displays to update
         '''
+        posts = []
         for subreddit in self.subreddits:
-            for attempt in range(1, 4, 1):
-                self.logger.info('Attempt %d to load %s', attempt, subreddit)
-                try:
-                    posts = self._subreddit_load(subreddit)
-                    if posts:
-                        break
-                except requests.HTTPError as exc:
-                    self.logger.warning('Failed to load "%s": %s',
-                                        subreddit, exc)
-                    break
+            self.logger.info('Loading %s', subreddit)
+            try:
+                posts += self._subreddit_load(subreddit)
+            except (requests.HTTPError, requests.ConnectionError,
+                    requests.Timeout, requests.exceptions.RetryError) as exc:
+                self.logger.warning('Failed to load "%s": %s', subreddit, exc)
         posts_image = [post for post in posts if post.is_image()]
         if not posts_image:
             self.logger.error('No post with image found')
@@ -227,26 +321,80 @@ class BackgroundChanger:
         self.selected = random.choices(posts_image, k=len(self.displays))
         return self.selected
 
+    def _nitrogen_restore(self, images):
+        '''
+        Set the background of all the displays with a single nitrogen call,
+        "images" being a list of (display, image path) tuples.
+        The heads are written in a nitrogen configuration of its own, in the
+        cache directory, so that the user one is left untouched.
+        '''
+        config = configparser.ConfigParser(interpolation=None)
+        config.optionxform = str
+        for disp, dest_img in images:
+            config[f'xin_{disp.num}'] = {
+                'file': os.path.abspath(dest_img),
+                'mode': str(self.NITROGEN_MODE_ZOOM_FILL),
+                'bgcolor': '#000000',
+            }
+        config_dir = os.path.join(self.CACHE_DIR, 'nitrogen')
+        os.makedirs(config_dir, exist_ok=True)
+        with open(os.path.join(config_dir, 'bg-saved.cfg'), 'wt',
+                  encoding='utf-8') as config_fp:
+            config.write(config_fp, space_around_delimiters=False)
+        cmd = ['nitrogen', '--restore']
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('Running "%s"', cmd)
+        subprocess.check_call(cmd, close_fds=False,
+                              env=dict(os.environ,
+                                       XDG_CONFIG_HOME=self.CACHE_DIR))
+
     def update(self, directory, meta=False):
         '''
         Update the backgroup of the display(s). Load the posts if not
         previously done
         '''
-        if not self.selected:
-            self.load()
-        date = datetime.datetime.now().strftime('%Y%m%d-%H%M')
-        for disp, post in zip(self.displays, self.selected):
-            self.logger.info('Using post "%s" for display %s', post, disp)
-            if meta:
-                post.download_meta(os.path.join(directory,
-                                                f'{date}-{disp.num}-meta.txt'))
-            dest_img = os.path.join(directory,
-                                    f'{date}-{disp.num}background-.{post.ext}')
-            post.download_imig(dest_img)
-            cmd = (self.BACKGROUND_CHANGING_TOOL.split(' ')
-                   + [f'--head={disp.num}', dest_img])
-            self.logger.debug('Running "%s"', cmd)
-            subprocess.check_call(cmd)
+        try:
+            if not self.selected:
+                self.load()
+            date = datetime.datetime.now().strftime('%Y%m%d-%H%M')
+            downloads = []
+            for disp, post in zip(self.displays, self.selected):
+                self.logger.info('Using post "%s" for display %s', post, disp)
+                dest_img = os.path.join(
+                    directory, f'{date}-{disp.num}background-.{post.ext}')
+                meta_path = None
+                if meta:
+                    meta_path = os.path.join(directory,
+                                             f'{date}-{disp.num}-meta.txt')
+                downloads.append((disp, post, dest_img, meta_path))
+            if not downloads:
+                return
+
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=min(8, len(downloads))) as executor:
+                futures = []
+                for _, post, dest_img, meta_path in downloads:
+                    futures.append(executor.submit(post.download_imig,
+                                                   dest_img))
+                    if meta_path is not None:
+                        futures.append(executor.submit(post.download_meta,
+                                                       meta_path))
+                concurrent.futures.wait(futures)
+            for future in futures:
+                future.result()
+
+            if self.tool == self.BACKGROUND_CHANGING_TOOL:
+                self._nitrogen_restore([(disp, dest_img)
+                                        for disp, _, dest_img, _ in downloads])
+                return
+            for disp, _, dest_img, _ in downloads:
+                cmd = (self.tool.split(' ')
+                       + [f'--head={disp.num}', dest_img])
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug('Running "%s"', cmd)
+                subprocess.check_call(cmd, close_fds=False)
+        finally:
+            self.session.close()
 
 
 if __name__ == '__main__':
@@ -289,7 +437,7 @@ if __name__ == '__main__':
         sys.exit(0)
 
     bgc = BackgroundChanger(args.subreddits, display=args.display,
-                            loglevel=args.verbosity)
+                            loglevel=args.verbosity, tool=args.tool)
 
     if args.temporary:
         with tempfile.TemporaryDirectory() as dest:
@@ -9,14 +9,13 @@ https://vole.wtf/perfect-circle/
 
 import argparse
 import collections
+import functools
 import math
-import os
-import re
 import shutil
 import subprocess
 import sys
 import time
-from typing import List
+from typing import List, Tuple
 
 try:
     # python-libxdo package, _not_ the xdo package!
@@ -26,11 +25,23 @@ except ImportError:
     xdo = None
     XDO_LIB = False
 
+try:
+    import numpy as np
+    NUMPY_LIB = True
+except ImportError:
+    np = None
+    NUMPY_LIB = False
+
 
-REGEX_MOSELOC = re.compile(r'x:([0-9]+) y:([0-9]+).*')
 TOOLNAME = 'xdotool'
 
 
+@functools.lru_cache(maxsize=1)
+def _which_tool():
+    '''Look for TOOLNAME in the PATH, only once per process'''
+    return shutil.which(TOOLNAME)
+
+
 def float_positive(value):
     '''Check that value is a positive float number'''
     conv = float(value)
@@ -38,6 +49,33 @@ def float_positive(value):
         raise argparse.ArgumentTypeError(f'{value} is negative')
     return conv
 
+
+def compute_pos(x_start: int, y_start: int, radius: int, point_nb: int,
+                tweak: int) -> Tuple[List[int], List[int]]:
+    '''
+    Compute the circle coordinates around ("x_start", "y_start"), as the
+    lists of the x and of the y positions. See CircleDrawer.compute.
+    '''
+    circle_slice = 2 * math.pi / (point_nb - 1)
+    point_nb += tweak
+    if NUMPY_LIB:
+        points = radius * np.exp(
+            1j * circle_slice * np.arange(point_nb + 1, dtype=np.float64))
+        return ((x_start + points.real).astype(np.int32).tolist(),
+                (y_start + points.imag).astype(np.int32).tolist())
+    # Rotate the point by the slice angle with a complex multiplication
+    # instead of computing cos / sin for each point
+    rotation = complex(math.cos(circle_slice), math.sin(circle_slice))
+    point = complex(radius, 0.0)
+    xs = []
+    ys = []
+    for _ in range(point_nb + 1):
+        xs.append(int(x_start + point.real))
+        ys.append(int(y_start + point.imag))
+        point *= rotation
+    return xs, ys
+
+
 class CircleDrawer:
     '''
     Monkey typing, changing the function depending on XDO_LIB is an option, but
@@ -53,14 +91,15 @@ class CircleDrawer:
     Coord = collections.namedtuple('Coord', ['x', 'y'])
 
     def __init__(self):
-        self.coordinates = []
+        self.xs: List[int] = []
+        self.ys: List[int] = []
         self.toolpath = None
         self.xdo = None
 
         if XDO_LIB:
             self.xdo = xdo.Xdo()
             return
-        self.toolpath = shutil.which(TOOLNAME)
+        self.toolpath = _which_tool()
 
         if self.toolpath is not None:
             return
@@ -71,42 +110,57 @@ class CircleDrawer:
     def _draw_lib(self, sleep: float, mouse_press: bool = True):
         if mouse_press:
             self.xdo.mouse_down(xdo.CURRENTWINDOW, xdo.MOUSE_LEFT)
-        for coord in self.coordinates:
-            self.xdo.wait_for_mouse_move_to(coord.x, coord.y)
+        # move_mouse does not wait for the X server to report the motion, as
+        # wait_for_mouse_move_to does, the pace is given by the sleep instead
+        for x, y in zip(self.xs, self.ys):
+            self.xdo.move_mouse(x, y)
+            if sleep:
+                time.sleep(sleep)
         if mouse_press:
             self.xdo.mouse_up(xdo.CURRENTWINDOW, xdo.MOUSE_LEFT)
 
     def _draw_tool(self, sleep: float, mouse_press: bool = True):
-        cmds = [f'mousemove {coord.x} {coord.y} sleep {sleep}'
-                for coord in self.coordinates]
+        cmd_format = f'mousemove {{}} {{}} sleep {sleep}'.format
+        cmds = [cmd.encode('ascii')
+                for cmd in map(cmd_format, self.xs, self.ys)]
         if mouse_press:
-            cmds = [cmds[0], 'mousedown 1'] + cmds[1:] + ['mouseup 1']
+            cmds = [cmds[0], b'mousedown 1'] + cmds[1:] + [b'mouseup 1']
         self._tool_run(cmds)
 
     def _mouse_location_tool(self):
-        output = self._tool_run(['getmouselocation'])
-        match = REGEX_MOSELOC.match(output)
-        if match is None:
+        output = self._tool_run([b'getmouselocation'])
+        # xdotool prints "x:NNN y:NNN screen:N window:NNN"
+        fields = output.split()
+        try:
+            x_field, y_field = fields[:2]
+            if not (x_field.startswith('x:') and y_field.startswith('y:')):
+                raise ValueError(output)
+            return CircleDrawer.Coord(int(x_field[2:]), int(y_field[2:]))
+        except ValueError as exc:
             raise CircleDrawer.ExecutionError(
-                f'Failed to get mouse current location from "{output}"')
-        vals = (int(val) for val in match.groups())
-        return CircleDrawer.Coord(*vals)
+                f'Failed to get mouse current location from "{output}"'
+            ) from exc
 
     def _mouse_location_lib(self) -> 'CircleDrawer.Coord':
         loc = self.xdo.get_mouse_location()
         return CircleDrawer.Coord(loc.x, loc.y)
 
-    def _tool_run(self, commands: List[str]):
-        cmds_str = ''.join([f'{cmd}{os.linesep}' for cmd in commands]).encode()
+    def _tool_run(self, commands: List[bytes]):
+        # xdotool only executes a script once its input is closed, so the
+        # commands cannot be streamed to a long-lived process: they are sent
+        # as a single batch to one process per call instead.
+        payload = b'\n'.join(commands) + b'\n'
+        # Python file descriptors are not inheritable, so there is no need to
+        # close them in the child, allowing subprocess to use posix_spawn
         try:
-            with subprocess.Popen([self.toolpath, '-'],
-                                  stdin=subprocess.PIPE,
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE) as proc:
-                stdout, _ = proc.communicate(cmds_str)
+            proc = subprocess.run([self.toolpath, '-'], input=payload,
+                                  capture_output=True, check=True,
+                                  close_fds=False)
         except subprocess.CalledProcessError as call_exc:
-            raise CircleDrawer.ExecutionError(call_exc)
-        return stdout.decode()
+            raise CircleDrawer.ExecutionError(
+                f'{TOOLNAME} failed with code {call_exc.returncode}: '
+                f'{call_exc.stderr.decode().strip()}') from call_exc
+        return proc.stdout.decode()
 
     def compute(self, start: 'CircleDrawer.Coord',
                 radius: int, point_nb: int, tweak: int) -> None:
@@ -118,14 +172,13 @@ class CircleDrawer:
         Note: one number is first deducted to the number of points to account
         for the last point being the same as the first to complete the loop.
         '''
-        circle_slice = 2 * math.pi / (point_nb - 1)
-        point_nb += tweak
-        self.coordinates = [
-            CircleDrawer.Coord(
-                int(start.x + radius * math.cos(point * circle_slice)),
-                int(start.y + radius * math.sin(point * circle_slice)))
-            for point in range(point_nb + 1)
-        ]
+        self.xs, self.ys = compute_pos(start.x, start.y, radius, point_nb,
+                                       tweak)
+
+    @property
+    def coordinates(self) -> List['CircleDrawer.Coord']:
+        '''The computed circle coordinates, as a list of CircleDrawer.Coord'''
+        return [CircleDrawer.Coord(x, y) for x, y in zip(self.xs, self.ys)]
 
     def draw(self, sleep: float, mouse_press: bool) -> None:
         '''draw the circle with the mouse, sleeping "sleep" seconds between
@@ -1,26 +1,36 @@
 #! /usr/bin/env python
 
 from argparse import ArgumentParser
-from collections import defaultdict
 import logging
 import re
 import signal
 import sys
 
 import colorama
-import editdistance
 from git import Repo
 from git.objects import Commit
+import numpy as np
 from progress.bar import Bar
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
+
+
+# Commit objects use __slots__, so the Change-Ids are cached by commit
+# binary SHA here rather than on the objects
+COMMIT_CHANGE_IDS = {}
 
 
 # Borrowed from PyEsr
 def commit_change_id(obj):
     '''Retrieve the Change-Id from the given commit'''
+    try:
+        return COMMIT_CHANGE_IDS[obj.binsha]
+    except KeyError:
+        pass
     match = obj.CHANGE_ID_REGEX.search(obj.message.lower())
-    if not match:
-        return None
-    return match.group(1)
+    change_id = match.group(1) if match else None
+    COMMIT_CHANGE_IDS[obj.binsha] = change_id
+    return change_id
 
 def commit_short(obj):
     return f'{obj.hexsha[:12]} "{obj.summary}"'
@@ -46,21 +56,6 @@ class Result:
     def __str__(self):
         return self.__class__.__name__
 
-    @classmethod
-    def merge(cls, results):
-        logger = logging.getLogger(f'BranchDiff.{cls.__name__}')
-        res_dict = defaultdict(list)
-        for result in results:
-            value = result.confidence * result.weight
-            res_dict[value].append(result)
-        logger.debug('Merging results')
-        for value, val_res in res_dict.items():
-            res_str = ' '.join([str(res) for res in val_res])
-            logger.debug(f'  Result with {value}: {res_str}')
-        ret = res_dict[max(res_dict.keys())][0]
-        logger.debug(f'-> winning result: {ret}')
-        return ret
-
 
 class ResultMatch(Result):
     POSITIVE = True
@@ -87,73 +82,28 @@ class ResultFail(Result):
         super().__init__(commit1, commit2, 0)
 
 
+# The comparisons are all done in BranchDiff._compare, the comparators only
+# tag the results with the kind of match and its weight
 class CommitCompare:
     THRESHOLD = None
     WEIGHT = 0
 
-    def __init__(self, logger=None):
-        self.logger = logger
-        if self.logger is None:
-            self.logger = logging.getLogger(
-                f'BranchDiff.{CommitCompare.__name__}')
-
-    @classmethod
-    def logcall(cls, func):
-        def wrapped_call(self, commit1, commit2):
-            ret = func(self, commit1, commit2)
-            self.logger.info(f'{self.__class__.__name__}: {ret}')
-            return ret
-        return wrapped_call
-
-    def __call__(self, commit1, commit2):
-        raise NotImplementedError
-
 
 class CommitCompareSubject(CommitCompare):
     THRESHOLD = 0.7
     WEIGHT = 0.4
 
-    @CommitCompare.logcall
-    def __call__(self, commit1, commit2):
-        distance = editdistance.eval(commit1.summary, commit2.summary)
-        if distance == 0:
-            self.logger.debug(
-                f'no distance between {commit1.summary} and {commit2.summary}')
-            return ResultMatchPartial(self, commit1, commit2,
-                                      Result.CONFIDENCE_MAX)
-        distance /= max(len(commit1.summary), len(commit2.summary))
-        distance = Result.CONFIDENCE_MAX - distance
-        self.logger.debug(
-            f'distance "{commit1.summary}" / "{commit2.summary}": {distance}')
-        if distance >= self.THRESHOLD:
-            return ResultMatchPartial(self, commit1, commit2, distance)
-        return ResultFail(commit1, commit2)
-
 
 class CommitCompareSafe(CommitCompare):
     WEIGHT = Result.WEIGHT_MAX
 
 
 class CommitCompareHash(CommitCompareSafe):
-    @CommitCompare.logcall
-    def __call__(self, commit1, commit2):
-        ret = commit1.hexsha == commit2.hexsha
-        self.logger.debug(f'{commit1.hexsha} == {commit2.hexsha}: {ret}')
-        if ret:
-            return ResultMatchFull(self, commit1)
-        return ResultFail(commit1, commit2)
+    pass
 
 
 class CommitCompareChangeId(CommitCompareSafe):
-    @CommitCompare.logcall
-    def __call__(self, commit1, commit2):
-        ret = (commit1.change_id and commit2.change_id and
-               commit1.change_id == commit2.change_id)
-        self.logger.debug(f'{commit1.change_id} == {commit2.change_id}: {ret}')
-        if ret:
-            return ResultMatchPartial(self, commit1, commit2,
-                                      Result.CONFIDENCE_MAX)
-        return ResultFail(commit1, commit2)
+    pass
 
 
 class BranchDiff:
@@ -167,12 +117,14 @@ class BranchDiff:
         self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.addHandler(handler)
         self.logger.setLevel(loglevel)
+        # Check the levels once, to skip building the messages of the
+        # per-commit logs when they are not shown
+        self._debug = self.logger.isEnabledFor(logging.DEBUG)
+        self._info = self.logger.isEnabledFor(logging.INFO)
         self.results = []
-        self.compare_obj = [
-            CommitCompareHash(),
-            CommitCompareChangeId(),
-            CommitCompareSubject()
-        ]
+        self.compare_hash = CommitCompareHash()
+        self.compare_change_id = CommitCompareChangeId()
+        self.compare_subject = CommitCompareSubject()
 
     def _compare(self):
         def signal_handler(signal, frame):
@@ -181,41 +133,87 @@ class BranchDiff:
         self.results = []
         commits1 = list(self.repo.iter_commits(self.rev_range1))
         commits2 = list(self.repo.iter_commits(self.rev_range2))
-        checked = []
+        # Read the compared commit fields once, in parallel lists, rather
+        # than through the Commit properties in the loops
+        hexshas1 = [commit.hexsha for commit in commits1]
+        change_ids1 = [commit.change_id for commit in commits1]
+        hexshas2 = [commit.hexsha for commit in commits2]
+        change_ids2 = [commit.change_id for commit in commits2]
+        # Exact matches are looked up directly, only the remaining commits
+        # need their subjects compared
+        by_sha = dict(zip(hexshas2, commits2))
+        by_cid = {}
+        for change_id, commit in zip(change_ids2, commits2):
+            if change_id:
+                by_cid.setdefault(change_id, commit)
+        checked = set()
+        results = [None] * len(commits1)
+        unresolved1 = []
         bar = Bar('Comparing', max=len(commits1))
         signal.signal(signal.SIGINT, signal_handler)
-        for commit1 in commits1:
-            self.logger.info(f'Checking {commit1}')
-            commit1_res = []
-            for commit2 in commits2:
-                self.logger.info(f'  against {commit2}')
-                result = self.compare_commits(commit1, commit2)
-                commit1_res.append(result)
-                self.logger.info(f'    {result}')
-                if result.POSITIVE:
-                    checked.append(commit2)
-            result = Result.merge(commit1_res)
-            self.logger.info(f'    -> {result}')
-            self.results.append(result)
+        for idx, commit1 in enumerate(commits1):
+            if hexshas1[idx] in by_sha:
+                result = ResultMatchFull(self.compare_hash, commit1)
+            elif change_ids1[idx] in by_cid:
+                result = ResultMatchPartial(self.compare_change_id, commit1,
+                                            by_cid[change_ids1[idx]],
+                                            Result.CONFIDENCE_MAX)
+            else:
+                unresolved1.append(idx)
+                continue
+            if self._info:
+                self.logger.info(f'Checking {commit1}')
+                self.logger.info(f'    -> {result}')
+            checked.add(result.commit_dest.hexsha)
+            results[idx] = result
+            bar.next()
+
+        unresolved2 = [idx for idx, hexsha in enumerate(hexshas2)
+                       if hexsha not in checked]
+        # Compute all the remaining subject similarities in a single batch,
+        # spread over all the CPUs, keeping the best match of each commit
+        threshold = self.compare_subject.THRESHOLD
+        if unresolved1 and unresolved2:
+            scores = process.cdist(
+                [commits1[idx].summary for idx in unresolved1],
+                [commits2[idx].summary for idx in unresolved2],
+                scorer=Levenshtein.normalized_similarity,
+                score_cutoff=threshold, dtype=np.float64, workers=-1)
+            best = scores.argmax(axis=1)
+            for col in np.flatnonzero((scores >= threshold).any(axis=0)):
+                checked.add(hexshas2[unresolved2[col]])
+        for row, idx in enumerate(unresolved1):
+            commit1 = commits1[idx]
+            result = ResultFail(commit1, None)
+            if unresolved2:
+                col = best[row]
+                confidence = float(scores[row, col])
+                if confidence >= threshold:
+                    result = ResultMatchPartial(self.compare_subject, commit1,
+                                                commits2[unresolved2[col]],
+                                                confidence)
+                    if self._debug:
+                        self.logger.debug(
+                            f'best subject "{commit1.summary}" / '
+                            f'"{result.commit_dest.summary}": {confidence}')
+                elif self._debug:
+                    self.logger.debug(f'no subject similar to '
+                                      f'"{commit1.summary}" above {threshold}')
+            if self._info:
+                self.logger.info(f'Checking {commit1}')
+                self.logger.info(f'    -> {result}')
+            results[idx] = result
             bar.next()
         bar.finish()
         signal.signal(signal.SIGINT, signal.SIG_DFL)
+        self.results = results
 
-        for commit in [comt for comt in commits2 if comt not in checked]:
-            self.logger.info(f'{commit.short()} not previously seen')
+        for commit in [comt for comt, hexsha in zip(commits2, hexshas2)
+                       if hexsha not in checked]:
+            if self._info:
+                self.logger.info(f'{commit.short()} not previously seen')
             self.results.append(ResultFail(None, commit))
 
-    def compare_commits(self, commit1, commit2):
-        results = []
-        for func in self.compare_obj:
-            result = func(commit1, commit2)
-            results.append(result)
-            if result.confidence == Result.CONFIDENCE_MAX:
-                self.logger.info(
-                    f'Found maximum confidence result, skipping other tests')
-                break
-        return Result.merge(results)
-
     def compare(self):
         def result_print_filter(msg, filter_cond, show_func):
             results_filtered = [result for result in self.results
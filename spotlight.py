@@ -1,5 +1,6 @@
 import os
 import pathlib
+import shutil
 
 from PIL import Image
 
@@ -14,18 +15,26 @@ dir_src = pathlib.Path(os.environ["LocalAppData"]).joinpath("Packages",
     "Microsoft.Windows.ContentDeliveryManager_cw5n1h2txyewy", "LocalState",
     "Assets")
 
-def filter_file_size(_filename):
-    return os.path.isfile(_filename) and os.path.getsize(_filename) > SIZE_MIN
+def filter_file_size(_entry):
+    # DirEntry caches its stat result, and is_file() usually does not need one
+    return _entry.is_file() and _entry.stat().st_size > SIZE_MIN
 
-files = list(filter(filter_file_size, dir_src.iterdir()))
+with os.scandir(dir_src) as entries:
+    files = [entry.path for entry in entries if filter_file_size(entry)]
 for filename in files:
+    # Only the header is needed to get the size and format, the pixels are
+    # not decoded
     with Image.open(filename, mode="r", formats=None) as img:
-        if img.width < WIDTH_MIN or img.width < img.height:
-            continue
-        file_basename = os.path.basename(filename)
-        file_dest = dest.joinpath(f"f{file_basename}.{img.format.lower()}")
-        if file_dest.exists():
-            print(f"{file_dest} already exists")
-        else:
-            img.save(file_dest)
-            print(f"Saved {file_dest}")
+        width, height = img.size
+        img_format = img.format
+    if width < WIDTH_MIN or width < height:
+        continue
+    file_basename = os.path.basename(filename)
+    file_dest = dest.joinpath(f"f{file_basename}.{img_format.lower()}")
+    if file_dest.exists():
+        print(f"{file_dest} already exists")
+    else:
+        # The asset is already in its final format, copy it as is instead of
+        # decoding and encoding it again
+        shutil.copyfile(filename, file_dest)
+        print(f"Saved {file_dest}")